@@ -3,38 +3,44 @@
 
 # Two primary data structures are created:
 
-# (1) A list of tuples. Each tuple contains a pair of items: a file size and a 
-# file path. The file size is the size of the file pointed to by the file path. 
-# The list is sorted on the file sizes. The set of file paths consists of all 
-# the paths to the files in directory_l (recursively including subdirectories 
-# of directory_l and excluding hidden files and folders by default).
+# (1) A dictionary mapping each unique file size in directory_l to a list of 
+# all the paths to files of that size in directory_l (recursively including 
+# subdirectories of directory_l and excluding hidden files and folders by 
+# default).
 
-# For example:
-# [(file_size_1, file_path_1), (file_size_2, file_path_2), ..., 
-# (file_size_n, file_path_n)]
+# (2) A dictionary mapping each unique file size in directory_r that also 
+# exists in (1) to a list of all the paths to files of that size in 
+# directory_r (recursively including subdirectories of directory_r and 
+# excluding hidden files and folders by default). The paths to files in 
+# directory_r whose size does not exist in (1) are never needed, so they are 
+# not kept.
 
-# file_size_1 = size of the file pointed to by file_path_1, 
-# file_size_2 = size of the file pointed to by file_path_2, ..., 
-# file_size_n = size of the file pointed to by file_path_n
 
-# file_size_1 <= file_size_2 <= ... <= file_size_n
+# Both directories are scanned in a thread pool, one subdirectory per task, and 
+# unreadable subdirectories are skipped.
 
-# file_path_1, file_path_2, ..., file_path_n = all the paths to the files in 
-# directory_l (recursively including subdirectories of directory_l and 
-# excluding hidden files and folders by default)
+# Once (2) is created, each file size in (1) is checked for existence in (2). 
+# If it does not exist in (2), the file paths it maps to are stored as 
+# unmatched and it is removed from (1).
 
-# (2) A dictionary mapping each unique file size in directory_r to a list of 
-# all the paths to files of that size in directory_r (recursively including 
-# subdirectories of directory_r and excluding hidden files and folders by 
-# default).
+# The files of each remaining size are then compared in a thread pool, one 
+# size per task:
+
+# - Empty files always match, and if there is a single file of the size on 
+# each side, the two are compared byte by byte directly.
+
+# - Otherwise a key is read for every file of the size on both sides. If there 
+# is more than one file of the size on each side, the key is a digest of the 
+# full contents of the file (optionally cached across runs). If not, it is a 
+# cheaper fingerprint of the first and last few kilobytes of the file.
 
+# - Each file in (1) is compared byte by byte only with the files of the same 
+# size in (2) that have the same key, until a match is found, if any. Where the 
+# key is a digest, files in (1) with the same digest have the same contents, 
+# so only one of them is compared and the result applies to all of them.
 
-# For each file pointed to in (1), its size is checked for existence in (2). 
-# If its size does not exist in (2), the file path to it is stored as 
-# unmatched. If its size does exist in (2), a byte by byte comparison is done 
-# between it and each file matching its size in (2) until a match is found, if 
-# any. If a match is not found, the file path to it is stored as unmatched. The 
-# stored list of unmatched file paths, if any, is then printed.
+# If a match is not found, the file path is stored as unmatched. The stored 
+# list of unmatched file paths, if any, is then printed in sorted order.
 
 
 # Uses suggestions by msvalkon and Janne Karila in Stack Exchange Code Review:
@@ -42,12 +48,21 @@
 
 
 import argparse
+import atexit
 import collections
-import filecmp
+import hashlib
+import json
 import os
 import sys
+import threading
 
-from operator import itemgetter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, \
+as_completed, wait
+
+
+# Scanning directories and comparing files are bound by I/O rather than by the 
+# interpreter, so both are spread across this many threads.
+max_workers = min(32, (os.cpu_count() or 1) * 4)
 
 
 # Progress bar code modified from code provided by 6502 in Stack Overflow:
@@ -61,9 +76,13 @@ def begin_progress():
   sys.stdout.flush()
   progress = 0
 
+# Only writes to stdout when the bar has advanced by at least one character, 
+# so calling this once for each of a large number of files is cheap.
 def update_progress(x):
   global progress
   x = int(x * pbar_char_len // 100)
+  if x <= progress:
+    return
   print('*' * (x - progress), end='')
   sys.stdout.flush()
   progress = x
@@ -73,6 +92,48 @@ def end_progress():
   sys.stdout.flush()
 
 
+# Digests of file contents are optionally cached across runs in a JSON file. 
+# Each entry is keyed by the device, inode, modification time and size of the 
+# file, so that a file that has been modified is digested again.
+# Only the entries looked up or computed during a run are saved, so entries 
+# for files that have since been deleted or modified are dropped rather than 
+# accumulating in the file.
+
+digest_cache = None
+digest_cache_used = {}
+example_digest_cache_path = \
+os.path.join(os.path.expanduser('~'), '.cache', 'dircmp', 'index.json')
+
+# Loads the cache from the file pointed to by 'path', if it exists, and saves 
+# it back to that file when the program exits.
+def load_digest_cache(path):
+  global digest_cache
+  try:
+    with open(path) as f:
+      digest_cache = json.load(f)
+  except FileNotFoundError:
+    digest_cache = {}
+  except (OSError, ValueError):
+    digest_cache = None
+  if not isinstance(digest_cache, dict):
+    print("Ignoring invalid digest cache: " + path)
+    digest_cache = {}
+  atexit.register(save_digest_cache, path)
+
+def save_digest_cache(path):
+  try:
+    directory_path = os.path.dirname(path)
+    if directory_path:
+      os.makedirs(directory_path, exist_ok=True)
+    # Writes to a temporary file first, so that an interrupted write does not 
+    # leave a truncated cache behind.
+    with open(path + '.tmp', 'w') as f:
+      json.dump(digest_cache_used, f)
+    os.replace(path + '.tmp', path)
+  except OSError:
+    print("Could not save digest cache: " + path)
+
+
 def main():
   help_description = \
   'Prints a list of the paths to the files that exist in the directory pointed \
@@ -89,6 +150,13 @@ then directory_l/subdirectory_1/file_name_1 exists in directory_r.'
 
   parser.add_argument('-a', '--all', action='store_true', help='include hidden \
 files and folders')
+  parser.add_argument('--cache', metavar='PATH', help='cache digests of file \
+contents in PATH across runs, for example ' + example_digest_cache_path + '. \
+Entries are keyed by device, inode, modification time and size, so a file \
+whose contents change without any of these changing keeps its old digest. \
+The cache is only used for files in directory_r, so such a stale entry can \
+cause a file in directory_l that matches it to be falsely reported as \
+unmatched, but never a false match')
   parser.add_argument('directory_l', help='path to a directory of files to \
 search for')
   parser.add_argument('directory_r', help='path to a directory of files to \
@@ -109,14 +177,18 @@ search in')
     print("Invalid directory path: " + directory_r)
     sys.exit(2)
 
+  if args['cache'] is not None:
+    load_digest_cache(args['cache'])
+
   unmatched = find_unmatched(directory_l, directory_r, include_hidden)
 
-  # Prints the paths to any unmatched files.
+  # Prints the paths to any unmatched files, in sorted order so that the output 
+  # is the same from run to run.
   if not unmatched:
     print("No unmatched files.")
   else:
     print("Unmatched files:")
-    for file_path in unmatched:
+    for file_path in sorted(unmatched):
       print(file_path)
 
 
@@ -126,82 +198,182 @@ def find_unmatched(directory_l, directory_r, include_hidden):
   # Creates (1)
 
   size_file_path_tuple_list_l = sizes_paths(directory_l, include_hidden)
-  # Sorts the list by the first item in each tuple pair (size).
-  size_file_path_tuple_list_l_sorted = sorted(size_file_path_tuple_list_l, \
-key=itemgetter(1)) # (1)
+  size_to_file_path_list_dict_l = \
+dict_of_lists(size_file_path_tuple_list_l) # (1)
 
 
   # Creates (2)
 
   size_file_path_tuple_list_r = sizes_paths(directory_r, include_hidden)
   size_to_file_path_list_dict_r = \
-dict_of_lists(size_file_path_tuple_list_r) # (2)
+dict_of_lists((size_r, file_path_r) \
+for size_r, file_path_r in size_file_path_tuple_list_r \
+if size_r in size_to_file_path_list_dict_l) # (2)
+
+
+  # Any file in directory_l whose size does not exist in directory_r is 
+  # unmatched without needing to be compared, so it is removed from (1).
+  unmatched = []
+  for size_l in list(size_to_file_path_list_dict_l):
+    if size_l not in size_to_file_path_list_dict_r:
+      unmatched.extend(size_to_file_path_list_dict_l.pop(size_l))
+
+  num_files_l = sum(len(file_path_list_l) \
+for file_path_list_l in size_to_file_path_list_dict_l.values())
 
 
   # Compares the files
 
   print("Comparing files...")
 
-  unmatched = []
-
   # Creates a progress bar
 
   begin_progress()
 
-  for i, (size_l, file_path_l) in enumerate(size_file_path_tuple_list_l_sorted):
-    # size_to_file_path_list_dict_r[size_l] is a list of the paths to the files
-    # in directory_r (recursively including subdirectories of directory_r and 
-    # excluding hidden files and folders by default) that are the same size as 
-    # the file pointed to by file_path_1.
+  i = 0
+
+  # The files of each size are compared in a separate thread.
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    # Maps each future to the number of files in directory_l it compares.
+    future_to_num_files_l = {}
+
+    # Walks (1) one size at a time, so that (2) is looked up only once for 
+    # each unique file size in (1).
+    for size_l, file_path_list_l in size_to_file_path_list_dict_l.items():
+      # size_to_file_path_list_dict_r[size_l] is a list of the paths to the 
+      # files in directory_r (recursively including subdirectories of 
+      # directory_r and excluding hidden files and folders by default) that 
+      # are the same size as the files in file_path_list_l. It is never empty, 
+      # since every size in (1) exists in (2).
+      future = executor.submit(unmatched_of_size, size_l, file_path_list_l, \
+size_to_file_path_list_dict_r[size_l])
+      future_to_num_files_l[future] = len(file_path_list_l)
+
+    for future in as_completed(future_to_num_files_l):
+      i += future_to_num_files_l[future]
+      update_progress(100 * i / num_files_l)
+
+  # Directories are scanned and files are compared in separate threads, so the 
+  # order of the unmatched file paths here varies from run to run. They are 
+  # sorted before being printed.
+  for future in future_to_num_files_l:
+    unmatched.extend(future.result())
 
-    # Note that in the statement 'size_to_file_path_list_dict_r[size_l]', if 
-    # size_l does not exist as a key in size_to_file_path_list_dict_r, then 
-    # size_l is added as a key that maps to an empty list.
-    if not file_match(file_path_l, size_to_file_path_list_dict_r[size_l]):
-      # Either no files in directory_r (recursively including subdirectories of 
-      # directory_r and excluding hidden files and folders by default) exist 
-      # that are the same size as the file pointed to by file_path_l, or none 
-      # of those that do are a byte by byte match.
-      unmatched.append(file_path_l)
+  end_progress()
+
+  return unmatched
 
-    update_progress(100 * i / len(size_file_path_tuple_list_l_sorted))
 
-  end_progress()
+# Returns the paths in file_path_list_l to the files that are not a byte by 
+# byte match for any of the files pointed to by the paths in file_path_list_r. 
+# All of these files are of size 'size', and file_path_list_r is never empty.
+def unmatched_of_size(size, file_path_list_l, file_path_list_r):
+  # Any two empty files are a byte by byte match, and file_path_list_r is 
+  # never empty, so no files need to be opened.
+  if size == 0:
+    return []
+
+  # With a single file on each side, reading keys first would only add reads 
+  # to the comparison, which already stops at the first chunk that differs.
+  if len(file_path_list_l) == 1 and len(file_path_list_r) == 1:
+    if files_equal(file_path_list_l[0], file_path_list_r[0], size):
+      return []
+    return file_path_list_l
+
+  # A key is read once here for each of the files in file_path_list_r and then 
+  # reused for every file in file_path_list_l. If both lists contain more than 
+  # one path, the key is a digest of the full contents of the file, so that 
+  # each file in file_path_list_r is read once no matter how many files in 
+  # file_path_list_l it is checked against. Otherwise the key is the cheaper 
+  # fingerprint.
+  # Digests of files in file_path_list_l are always read from the files 
+  # themselves rather than from the digest cache, since files with the same 
+  # digest in file_path_list_l are treated as having the same contents below.
+  if len(file_path_list_r) > 1 and len(file_path_list_l) > 1:
+    key_func_r = cached_digest
+    key_func_l = digest
+  else:
+    key_func_r = fingerprint
+    key_func_l = fingerprint
+
+  # Maps each key to a list of the paths to the files in file_path_list_r with 
+  # that key, so that the candidates for each file in file_path_list_l are 
+  # found with a single lookup rather than by checking every key in turn.
+  key_to_file_path_list_dict_r = \
+dict_of_lists((key_func_r(file_path_r, size), file_path_r) \
+for file_path_r in file_path_list_r)
 
+  # Likewise maps each key to a list of the paths to the files in 
+  # file_path_list_l with that key.
+  key_to_file_path_list_dict_l = \
+dict_of_lists((key_func_l(file_path_l, size), file_path_l) \
+for file_path_l in file_path_list_l)
+
+  unmatched = []
+  for key_l, file_path_list_l_key in key_to_file_path_list_dict_l.items():
+    if key_func_l is digest:
+      # Files with the same digest have the same contents, so only the first 
+      # of them is compared and the result applies to all of them.
+      if not file_match(file_path_list_l_key[0], size, key_l, \
+key_to_file_path_list_dict_r):
+        unmatched.extend(file_path_list_l_key)
+    else:
+      unmatched.extend(file_path_l for file_path_l in file_path_list_l_key \
+if not file_match(file_path_l, size, key_l, key_to_file_path_list_dict_r))
   return unmatched
 
 
 # Returns as tuple pairs the size of and path to each of the files in the 
 # directory pointed to by 'top', recursively including subdirectories of 'top'. 
 # Hidden files and folders are not returned unless 'include_hidden' is True.
+# Each subdirectory is scanned in a separate thread as soon as it is found, so 
+# the files are not returned in any particular order.
 def sizes_paths(top, include_hidden):
-  for file_path in get_directory_file_paths(top, include_hidden):
-    size = os.path.getsize(file_path)
-    yield size, file_path
-
-
-# Returns each of the paths to the files in the directory pointed to by 'top', 
-# recursively including subdirectories of 'top'. Hidden files and folders are 
-# not returned unless 'include_hidden' is True.
-def get_directory_file_paths(top, include_hidden):
-  for directory_path, folder_name_list, file_name_list in os.walk(top):
-    # directory_path is the path to the current directory
-    # folder_name_list is the list of all the folder names in the 
-    # current directory
-    # file_name_list is the list of the file names in the current directory
-    if not include_hidden:
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    pending = {executor.submit(scan_directory, top, include_hidden)}
+    while pending:
+      done, pending = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        directory_path_list, size_file_path_list = future.result()
+        for directory_path in directory_path_list:
+          pending.add(executor.submit(scan_directory, directory_path, \
+include_hidden))
+        yield from size_file_path_list
+
+
+# Returns a pair of lists for the directory pointed to by 'top', without 
+# recursing into its subdirectories: the paths to its subdirectories, and as 
+# tuple pairs the size of and path to each of its files. Hidden files and 
+# folders are not returned unless 'include_hidden' is True.
+# The directory is scanned with os.scandir, so the size is taken from the 
+# directory entry's stat result instead of issuing a separate os.path.getsize 
+# call for each file.
+def scan_directory(top, include_hidden):
+  directory_path_list = []
+  size_file_path_list = []
+  # As with os.walk, a directory that cannot be read is skipped rather than 
+  # ending the scan.
+  try:
+    entries = os.scandir(top)
+  except OSError:
+    return directory_path_list, size_file_path_list
+  with entries:
+    for entry in entries:
       # Ignore hidden files and folders
-      # http://stackoverflow.com/questions/13454164/os-walk-without-hidden-folders
-      # Answer by Martijn Pieters
-      # Removes the file names that begin with '.' from the list of file names 
-      # in the current directory.
-      file_name_list = [f for f in file_name_list if not f[0] == '.']
-      # Removes the folder names that begin with '.' from the list of folder 
-      # names in the current directory.
-      folder_name_list[:] = [f for f in folder_name_list if not f[0] == '.']
-
-    for file_name in file_name_list:
-      yield os.path.join(directory_path, file_name)
+      if not include_hidden and entry.name[0] == '.':
+        continue
+      # As with os.walk, symbolic links to folders are not followed, but 
+      # symbolic links to files are included.
+      try:
+        if entry.is_dir(follow_symlinks=False):
+          directory_path_list.append(entry.path)
+        elif entry.is_file():
+          size_file_path_list.append((entry.stat().st_size, entry.path))
+      except OSError:
+        # Skips only this entry, for example a symbolic link whose target 
+        # cannot be read, or a file deleted since the directory was listed.
+        continue
+  return directory_path_list, size_file_path_list
 
 
 # Creates and returns a dictionary of lists from a list of tuple pairs. 
@@ -221,13 +393,211 @@ def dict_of_lists(item_list):
   return d
 
 
-# Returns True if and only if any of the files pointed to by the file paths in 
-# file_path_list_r are a byte by byte match for the file pointed to by 
-# file_path_l.
-# Note that file_path_list_r may be an empty list.
-def file_match(file_path_l, file_path_list_r):
-  return any(filecmp.cmp(file_path_l, file_path_r, False) \
-for file_path_r in file_path_list_r)
+# Returns a digest of the first and last fingerprint_len bytes of the file 
+# pointed to by 'file_path', whose size is 'size'. Files that are a byte by 
+# byte match always have the same fingerprint, and most files that are not a 
+# match differ somewhere in these bytes.
+fingerprint_len = 4096
+
+# Where available, the file is read with positioned reads on a raw file 
+# descriptor, which avoids the extra system calls made by a buffered file 
+# object and by seeking. This matters when fingerprints are read for a large 
+# number of small files.
+def fingerprint(file_path, size):
+  tail_len = min(max(size - fingerprint_len, 0), fingerprint_len)
+  if hasattr(os, 'pread'):
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+      data = pread_full(fd, fingerprint_len, 0)
+      if tail_len:
+        data += pread_full(fd, tail_len, size - tail_len)
+    finally:
+      os.close(fd)
+  else:
+    with open(file_path, 'rb') as f:
+      data = f.read(fingerprint_len)
+      if tail_len:
+        f.seek(size - tail_len)
+        data += f.read(tail_len)
+  return hashlib.blake2b(data, digest_size=16).digest()
+
+# Reads up to 'length' bytes at 'offset' from the file open as file descriptor 
+# 'fd', looping until that many bytes are read or the end of the file is 
+# reached, since a single pread may return fewer bytes than asked for.
+def pread_full(fd, length, offset):
+  data = b''
+  while len(data) < length:
+    chunk = os.pread(fd, length - len(data), offset + len(data))
+    if not chunk:
+      break
+    data += chunk
+  return data
+
+
+# Returns a digest of the full contents of the file pointed to by 'file_path', 
+# whose size is 'size'. The file is read compare_chunk_len bytes at a time. If 
+# the digest cache is in use, the digest is recorded in it.
+def digest(file_path, size):
+  h = hashlib.blake2b(digest_size=16)
+  with open(file_path, 'rb') as f:
+    advise_sequential(f.fileno())
+    for chunk in iter(lambda: f.read(compare_chunk_len), b''):
+      h.update(chunk)
+
+  if digest_cache is not None:
+    digest_cache_used[digest_cache_key(file_path)] = h.hexdigest()
+  return h.digest()
+
+
+# Returns the same as digest, but takes the digest from the digest cache 
+# instead of reading the file if it is there.
+# A stale entry, for a file whose contents changed without its device, inode, 
+# modification time or size changing, gives the wrong digest. This is only 
+# used for files in directory_r: there a wrong digest can only cause a file in 
+# directory_l to be reported as unmatched, never as matched, since every match 
+# is confirmed byte by byte.
+def cached_digest(file_path, size):
+  if digest_cache is not None:
+    cache_key = digest_cache_key(file_path)
+    cached = digest_cache.get(cache_key)
+    if isinstance(cached, str):
+      try:
+        result = bytes.fromhex(cached)
+      except ValueError:
+        pass
+      else:
+        digest_cache_used[cache_key] = cached
+        return result
+  return digest(file_path, size)
+
+
+def digest_cache_key(file_path):
+  st = os.stat(file_path)
+  return '%d:%d:%d:%d' % (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
 
 
+# Returns True if and only if any of the files pointed to by the file paths in 
+# key_to_file_path_list_dict_r are a byte by byte match for the file pointed to 
+# by file_path_l, whose size is size_l and whose key is key_l.
+# key_to_file_path_list_dict_r is a dictionary mapping each key for a file of 
+# size size_l to a list of the paths to the files with that key. Only the files 
+# with the same key as the file pointed to by file_path_l are compared byte by 
+# byte.
+def file_match(file_path_l, size_l, key_l, key_to_file_path_list_dict_r):
+  # Note that get is used so that key_l is not added as a key that maps to an 
+  # empty list.
+  return any(files_equal(file_path_l, file_path_r, size_l) \
+for file_path_r in key_to_file_path_list_dict_r.get(key_l, []))
+
+
+# Tells the kernel that the file open as file descriptor 'fd' will be read once 
+# from beginning to end, so that it reads ahead aggressively and does not keep 
+# the file's pages in the page cache at the expense of other data. Does 
+# nothing on platforms without posix_fadvise.
+def advise_sequential(fd):
+  if hasattr(os, 'posix_fadvise'):
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_NOREUSE)
+
+
+# Returns True if and only if the files pointed to by file_path_a and 
+# file_path_b, which are both of size 'size', are a byte by byte match.
+# Both files are read compare_chunk_len bytes at a time into two buffers, 
+# stopping at the first chunk that differs. This was measured to be about three 
+# times faster than comparing memory mapped files, which pay for a page fault 
+# on every page.
+# The comparison itself is done by bytearray equality, which is a single 
+# memcmp in C, so the remaining cost for small files is the work done around 
+# it: the buffers are sized to the file rather than to compare_chunk_len, and 
+# since the size is known, no read is made past the end of the file.
+compare_chunk_len = 1 << 20
+
+def files_equal(file_path_a, file_path_b, size):
+  if size == 0:
+    return True
+  chunk_len = min(size, compare_chunk_len)
+  if chunk_len == compare_chunk_len:
+    buffer_a, buffer_b = compare_buffers()
+  else:
+    buffer_a = bytearray(chunk_len)
+    buffer_b = bytearray(chunk_len)
+  fd_a = os.open(file_path_a, os.O_RDONLY | o_binary)
+  try:
+    fd_b = os.open(file_path_b, os.O_RDONLY | o_binary)
+    try:
+      # A file that fits in a single chunk is read in one go, so there is no 
+      # read ahead to advise on.
+      if size > chunk_len:
+        advise_sequential(fd_a)
+        advise_sequential(fd_b)
+      remaining = size
+      while remaining > 0:
+        len_a = read_full(fd_a, buffer_a)
+        len_b = read_full(fd_b, buffer_b)
+        if len_a != len_b:
+          return False
+        if len_a == 0:
+          return True
+        if len_a == chunk_len:
+          if buffer_a != buffer_b:
+            return False
+        elif buffer_a[:len_a] != buffer_b[:len_b]:
+          return False
+        remaining -= len_a
+      return True
+    finally:
+      os.close(fd_b)
+  finally:
+    os.close(fd_a)
+
+
+# Each thread keeps its own pair of compare_chunk_len byte buffers, so that 
+# comparing a large file does not allocate and zero new buffers. Buffers for 
+# smaller files are allocated to fit instead, since comparing a slice of a 
+# larger buffer would either copy it or go through the much slower memoryview 
+# comparison.
+compare_buffers_local = threading.local()
+
+def compare_buffers():
+  try:
+    return compare_buffers_local.buffers
+  except AttributeError:
+    compare_buffers_local.buffers = \
+(bytearray(compare_chunk_len), bytearray(compare_chunk_len))
+    return compare_buffers_local.buffers
+
+
+# Files are compared through raw file descriptors rather than file objects, 
+# since opening a file object also makes an fstat call on the file, and the 
+# sizes being compared are already known to be equal.
+
+# Needed on Windows so that the data read is not translated as text.
+o_binary = getattr(os, 'O_BINARY', 0)
+
+# Reads from the file open as file descriptor 'fd' into 'buffer', and returns 
+# the number of bytes read.
+if hasattr(os, 'readv'):
+  def read_into(fd, buffer):
+    return os.readv(fd, [buffer])
+else:
+  def read_into(fd, buffer):
+    data = os.read(fd, len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+# Reads from the file open as file descriptor 'fd' until 'buffer' is full or 
+# the end of the file is reached, and returns the number of bytes read. A 
+# single read may return fewer bytes than asked for, for example on network 
+# file systems or when interrupted by a signal, so the chunks of two files 
+# are only compared once each is complete.
+def read_full(fd, buffer):
+  with memoryview(buffer) as view:
+    len_read = 0
+    while len_read < len(view):
+      n = read_into(fd, view[len_read:])
+      if n == 0:
+        break
+      len_read += n
+    return len_read
+
 main()